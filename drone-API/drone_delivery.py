@@ -1,50 +1,301 @@
+import time
+STARTUP_TIME = time.perf_counter()
+
+import os
+# Mission items carry mission_type, which only exists in MAVLink 2; the fence upload
+# depends on it to target MAV_MISSION_TYPE_FENCE. Must be set before pymavlink loads.
+os.environ.setdefault('MAVLINK20', '1')
+
 from flask import Flask, request, jsonify
 from pymavlink import mavutil
 import threading
-import time
 import math
 import logging
+import logging.handlers
+import json
+import queue
+import atexit
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from flask_cors import CORS
 import socket
 import argparse
+import signal
+import sys
+import uuid
+from geofence import GeofenceStore
+from mission_store import MissionStore, DEFAULT_PAGE_SIZE
+
+# Attributes every LogRecord carries; anything else was passed via `extra`
+RESERVED_LOG_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as single-line JSON objects, including `extra` fields."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in RESERVED_LOG_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class ContextLogger(logging.LoggerAdapter):
+    """Logger adapter that merges its context (e.g. drone_id) with per-call `extra`."""
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+
+class RateLimiter:
+    """Allows one event per interval and counts the ones it suppresses."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last_allowed = 0
+        self.suppressed = 0
+
+    def allow(self):
+        """Returns the number of events suppressed since the last allowed one, or None to suppress."""
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_allowed < self.interval:
+                self.suppressed += 1
+                return None
+            suppressed, self.suppressed = self.suppressed, 0
+            self.last_allowed = now
+            return suppressed
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that enqueues records unformatted.
+
+    The stock prepare() interpolates the message and renders the traceback on the
+    logging thread; here both are left to the listener's formatter. Because the
+    record is formatted later, callers must pass copies of mutable args and extras
+    that they keep changing.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+def configure_logging(level=logging.INFO):
+    """Routes all logging through a queue so formatting and I/O happen on a listener thread."""
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(JsonFormatter())
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    root = logging.getLogger()
+    root.handlers = [DeferredQueueHandler(log_queue)]
+    root.setLevel(level)
+    return listener
+
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Constants
 EARTH_RADIUS = 6371000  # in meters
+MAX_MISSION_DISTANCE = 1000  # in meters
+TELEMETRY_MAX_AGE = 3  # seconds before cached telemetry is considered stale
+TELEMETRY_POLL_INTERVAL = 0.05  # seconds between telemetry pump passes
+HEARTBEAT_TIMEOUT = 10  # seconds to wait for a heartbeat on each connection attempt
+RECONNECT_BACKOFF_MIN = 1  # seconds before the first connection retry
+RECONNECT_BACKOFF_MAX = 30
+MIN_GPS_SATELLITES = 6
+BATTERY_RESERVE_PERCENT = 20  # battery that must remain after the round trip
+BATTERY_PERCENT_PER_KM = 10  # estimated battery consumption per km flown
+# EKF solution flags required before arming (None if the dialect has no EKF_STATUS_REPORT)
+EKF_REQUIRED_FLAGS = (
+    mavutil.mavlink.EKF_ATTITUDE
+    | mavutil.mavlink.EKF_VELOCITY_HORIZ
+    | mavutil.mavlink.EKF_POS_HORIZ_ABS
+    | mavutil.mavlink.EKF_POS_VERT_ABS
+) if hasattr(mavutil.mavlink, 'EKF_ATTITUDE') else None
+IDEMPOTENCY_TTL = 600  # seconds a dispatch outcome is replayed for retries
+IDEMPOTENCY_MAX_ENTRIES = 1000
+TELEMETRY_LOG_INTERVAL = 5  # seconds between logged telemetry readings
+
+def elapsed(started):
+    """Returns the seconds since a time.perf_counter() reading, rounded for reporting."""
+    return round(time.perf_counter() - started, 4)
+
 
 class DroneController:
-    def __init__(self, connection_string, drone_id):
+    def __init__(self, connection_string, drone_id, geofence_path=None, site=None, mission_store=None):
         self.connection_string = connection_string
         self.drone_id = drone_id
+        self.mission_store = mission_store
+        self.armed = False
+        self.onboard_mission = None  # onboard mission as last seen on this link, None when unknown
+        self.active_flight = None  # (mission id, start time) of the mission being flown
+        self.geofence = GeofenceStore(geofence_path, site)
+        self.geofence_breach = None  # name of the no-fly zone the drone is currently in
         self.connection_lock = threading.Lock()
         self.connection_established = threading.Event()
         self.master = None
-
-    def initialize_connection(self):
+        self.connection_phase = "idle"
+        self.phase_timings = {}  # phase name -> seconds
+        self.logger = ContextLogger(logger, {"drone_id": drone_id})
+        self.location_log_limiter = RateLimiter(TELEMETRY_LOG_INTERVAL)
+        self.telemetry = {}  # message type -> (message, receive time)
+        self.telemetry_thread = None
+        self.preflight_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"preflight-{drone_id}")
+
+    def record_phase(self, phase, started):
+        """Records how long a startup or connection phase took."""
+        self.phase_timings[phase] = elapsed(started)
+
+    def initialize_connection(self, heartbeat_timeout=HEARTBEAT_TIMEOUT):
         """Initializes MAVLink connection."""
-        with self.connection_lock:
-            if self.master:
-                self.master.close()
-            self.master = mavutil.mavlink_connection(self.connection_string)
-        
         try:
-            self.master.wait_heartbeat()
-            logger.info("Heartbeat received; connection established.")
+            self.connection_phase = "connecting"
+            started = time.perf_counter()
+            with self.connection_lock:
+                self.onboard_mission = None
+                if self.master:
+                    self.master.close()
+                self.master = mavutil.mavlink_connection(self.connection_string)
+                self.master.message_hooks.append(self.record_telemetry)
+            self.record_phase("link_open", started)
+
+            self.connection_phase = "awaiting_heartbeat"
+            started = time.perf_counter()
+            if not self.master.wait_heartbeat(timeout=heartbeat_timeout):
+                raise TimeoutError("No heartbeat received")
+            self.record_phase("heartbeat", started)
+            self.logger.info("Heartbeat received; connection established.", extra={"connection": self.connection_string})
+
+            started = time.perf_counter()
             self.request_data_stream(mavutil.mavlink.MAV_DATA_STREAM_POSITION, rate=1)
+            self.request_data_stream(mavutil.mavlink.MAV_DATA_STREAM_EXTENDED_STATUS, rate=1)
+            self.request_data_stream(mavutil.mavlink.MAV_DATA_STREAM_EXTRA3, rate=1)
+            self.record_phase("stream_setup", started)
             self.connection_established.set()
+            self.connection_phase = "connected"
+            self.start_telemetry_pump()
+            self.logger.info("Connection phase timings", extra={"timings": dict(self.phase_timings)})
         except Exception as e:
-            logger.error(f"Failed to initialize connection: {str(e)}")
+            self.logger.error("Failed to initialize connection: %s", e)
+            self.connection_phase = "failed"
             self.connection_established.clear()
 
+    def connect_in_background(self):
+        """Brings the MAVLink link up on a background thread, retrying until it connects."""
+        thread = threading.Thread(target=self.reconnect, name=f"connect-{self.drone_id}", daemon=True)
+        thread.start()
+        return thread
+
     def get_master(self):
         """Retrieves the MAVLink connection, initializing if necessary."""
         if not self.connection_established.is_set():
             self.initialize_connection()
         return self.master
 
+    def record_telemetry(self, master, message):
+        """MAVLink message hook that caches the latest message of each type."""
+        self.telemetry[message.get_type()] = (message, time.time())
+        if message.get_type() == 'GLOBAL_POSITION_INT':
+            self.update_geofence_breach(message.lat / 1e7, message.lon / 1e7)
+        elif self.is_autopilot_heartbeat(master, message):
+            self.update_armed_state(bool(message.base_mode & mavutil.mavlink.MAV_MODE_FLAG_SAFETY_ARMED))
+        elif message.get_type() == 'MISSION_ACK':
+            # Only acks on this link are visible; uploads by other ground stations are caught
+            # by the fresh download that mission_matches_onboard does before skipping an upload
+            if getattr(message, 'mission_type', mavutil.mavlink.MAV_MISSION_TYPE_MISSION) == mavutil.mavlink.MAV_MISSION_TYPE_MISSION:
+                self.onboard_mission = None
+
+    def is_autopilot_heartbeat(self, master, message):
+        """Checks that a message is the vehicle autopilot's own HEARTBEAT.
+
+        Gimbals, cameras and companion computers share the system id but report
+        base_mode 0, which would otherwise look like a disarm.
+        """
+        return (message.get_type() == 'HEARTBEAT'
+                and message.get_srcSystem() == master.target_system
+                and message.get_srcComponent() == master.target_component
+                and message.autopilot != mavutil.mavlink.MAV_AUTOPILOT_INVALID
+                and message.type != mavutil.mavlink.MAV_TYPE_GCS)
+
+    def track_flight(self, mission_id):
+        """Starts timing the flight of a dispatched mission until the drone disarms."""
+        self.active_flight = (mission_id, time.time())
+
+    def update_armed_state(self, armed):
+        """Records the flight duration of the active mission when the drone disarms."""
+        if self.armed and not armed and self.active_flight:
+            mission_id, started = self.active_flight
+            self.active_flight = None
+            flight_duration = time.time() - started
+            self.logger.info("Flight finished", extra={"mission_id": mission_id, "flight_duration": flight_duration})
+            if self.mission_store:
+                self.mission_store.record_flight(mission_id, flight_duration)
+        self.armed = armed
+
+    def update_geofence_breach(self, lat, lon):
+        """Tracks whether the live position is inside a no-fly zone, logging transitions."""
+        zone = self.geofence.no_fly_zone_at(lat, lon)
+        breach = zone.name if zone else None
+        if breach != self.geofence_breach:
+            if breach:
+                self.logger.warning("Drone entered no-fly zone %s", breach, extra={"latitude": lat, "longitude": lon})
+            else:
+                self.logger.info("Drone left no-fly zone %s", self.geofence_breach)
+            self.geofence_breach = breach
+
+    def get_cached_message(self, message_type, max_age=TELEMETRY_MAX_AGE):
+        """Returns the cached message of the given type, or None if missing or stale."""
+        entry = self.telemetry.get(message_type)
+        if entry is None or time.time() - entry[1] > max_age:
+            return None
+        return entry[0]
+
+    def start_telemetry_pump(self):
+        """Starts the background thread that keeps the telemetry cache fresh."""
+        if self.telemetry_thread and self.telemetry_thread.is_alive():
+            return
+        self.telemetry_thread = threading.Thread(target=self.pump_telemetry, name=f"telemetry-{self.drone_id}", daemon=True)
+        self.telemetry_thread.start()
+
+    def pump_telemetry(self):
+        """Drains pending MAVLink messages whenever no mission exchange holds the link."""
+        while True:
+            if self.connection_established.is_set():
+                try:
+                    with self.connection_lock:
+                        while self.master.recv_match(blocking=False) is not None:
+                            pass
+                except Exception as e:
+                    self.logger.error("Telemetry link lost: %s", e)
+                    self.connection_established.clear()
+                    self.reconnect()
+            time.sleep(TELEMETRY_POLL_INTERVAL)
+
+    def reconnect(self):
+        """Re-initializes the link with exponential backoff until a heartbeat arrives."""
+        delay = RECONNECT_BACKOFF_MIN
+        while True:
+            self.initialize_connection()
+            if self.connection_established.is_set():
+                return
+            self.logger.warning("Connection attempt failed; retrying in %d s", delay)
+            time.sleep(delay)
+            delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+
     def calculate_distance(self, lat1, lon1, lat2, lon2):
         """Calculates the Haversine distance between two points on Earth."""
         phi1, phi2 = map(math.radians, [lat1, lat2])
@@ -58,72 +309,283 @@ class DroneController:
         self.master.mav.request_data_stream_send(self.master.target_system, self.master.target_component, stream_id, rate, 1)
 
     def get_current_location(self, timeout=10):
-        """Retrieves the current location of the drone."""
+        """Retrieves the current location of the drone, from the telemetry cache when it is fresh."""
+        message = self.get_cached_message('GLOBAL_POSITION_INT')
         start_time = time.time()
         while time.time() - start_time < timeout:
-            message = self.master.recv_match(type='GLOBAL_POSITION_INT', blocking=True, timeout=1)
+            if message is None:
+                message = self.master.recv_match(type='GLOBAL_POSITION_INT', blocking=True, timeout=1)
             if message:
                 lat = message.lat / 1e7
                 lon = message.lon / 1e7
                 alt = message.alt / 1000.0
-                logger.info(f"Current Location - Latitude: {lat}, Longitude: {lon}, Altitude: {alt} m")
+                suppressed = self.location_log_limiter.allow()
+                if suppressed is not None:
+                    self.logger.info("Current location", extra={"latitude": lat, "longitude": lon, "altitude": alt, "suppressed": suppressed})
                 return lat, lon, alt
         raise TimeoutError("Failed to get current location")
 
-    def execute_mission(self, drop_lat, drop_lon):
-        """Executes a predefined mission with given drop coordinates."""
+    def execute_mission(self, drop_lat, drop_lon, timings=None):
+        """Executes a predefined mission with given drop coordinates.
+
+        If a timings dict is given, the duration of each completed stage is stored in it.
+        """
+        timings = {} if timings is None else timings
         try:
             if not self.connection_established.is_set():
                 raise ConnectionError("No connection to the drone")
-
-            # Clear any existing mission
-            self.master.mav.mission_clear_all_send(self.master.target_system, self.master.target_component)
-            time.sleep(1)
-
-            # Get the current location and check distance to the drop point
-            current_lat, current_lon, current_alt = self.get_current_location()
-            distance = self.calculate_distance(current_lat, current_lon, drop_lat, drop_lon)
-            if distance > 1000:
-                raise ValueError(f"Drop coordinates are {distance:.2f}m away, exceeding the 1000m limit.")
-
-            # Define mission items (simplified here)
-            mission_items = [
-                self.create_mission_item(0, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, current_lat, current_lon, current_alt),
-                self.create_mission_item(1, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF, alt=10),
-                self.create_mission_item(2, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, drop_lat, drop_lon, 10),
-                self.create_mission_item(3, mavutil.mavlink.MAV_CMD_NAV_LOITER_TIME, drop_lat, drop_lon, 1),
-                self.create_mission_item(4, mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH)
-            ]
-
-            # Upload mission
-            self.upload_mission(mission_items)
-            # Arm and start mission
-            self.set_mode_and_arm()
-            self.start_mission()
+            if not self.geofence.in_delivery_zone(drop_lat, drop_lon):
+                raise ValueError("Drop coordinates are outside the delivery zones for this site.")
+
+            started = time.perf_counter()
+            with self.connection_lock:
+                timings["lock_wait"] = elapsed(started)
+
+                # Get the current location and check distance to the drop point
+                started = time.perf_counter()
+                current_lat, current_lon, current_alt = self.get_current_location()
+                timings["location"] = elapsed(started)
+                distance = self.calculate_distance(current_lat, current_lon, drop_lat, drop_lon)
+                if distance > MAX_MISSION_DISTANCE:
+                    raise ValueError(f"Drop coordinates are {distance:.2f}m away, exceeding the {MAX_MISSION_DISTANCE}m limit.")
+
+                # Define mission items (simplified here)
+                mission_items = [
+                    self.create_mission_item(0, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, current_lat, current_lon, current_alt),
+                    self.create_mission_item(1, mavutil.mavlink.MAV_CMD_NAV_TAKEOFF, alt=10),
+                    self.create_mission_item(2, mavutil.mavlink.MAV_CMD_NAV_WAYPOINT, drop_lat, drop_lon, 10),
+                    self.create_mission_item(3, mavutil.mavlink.MAV_CMD_NAV_LOITER_TIME, drop_lat, drop_lon, 1),
+                    self.create_mission_item(4, mavutil.mavlink.MAV_CMD_NAV_RETURN_TO_LAUNCH)
+                ]
+                violation = self.geofence.check_route(self.mission_route(mission_items, current_lat, current_lon))
+                if violation:
+                    raise ValueError(violation)
+
+                # Run pre-flight checks against cached telemetry while the mission uploads,
+                # skipping the upload when the vehicle already holds this mission
+                started = time.perf_counter()
+                preflight = self.preflight_executor.submit(self.run_preflight_checks, distance)
+                if self.mission_matches_onboard(mission_items):
+                    timings["upload_skipped"] = True
+                    timings["verify"] = elapsed(started)
+                else:
+                    # Clear any existing mission
+                    self.clear_mission()
+                    time.sleep(1)
+                    timings["clear"] = elapsed(started)
+                    self.upload_mission(mission_items)
+                    timings["upload"] = elapsed(started)
+                failures = preflight.result()
+                timings["preflight"] = elapsed(started)
+                if failures:
+                    self.clear_mission()
+                    raise RuntimeError(f"Pre-flight checks failed: {'; '.join(failures)}")
+
+                # Arm and start mission
+                started = time.perf_counter()
+                self.set_mode_and_arm()
+                timings["arm"] = elapsed(started)
+                started = time.perf_counter()
+                self.start_mission()
+                timings["start"] = elapsed(started)
             return True, "Mission started successfully"
         except Exception as e:
-            logger.error(f"Error during mission execution: {str(e)}")
+            self.logger.error("Error during mission execution: %s", e, extra={"drop_latitude": drop_lat, "drop_longitude": drop_lon})
             return False, str(e)
 
-    def create_mission_item(self, seq, command, lat=0, lon=0, alt=0, params=(0, 0, 0, 0)):
+    def mission_route(self, mission_items, home_lat, home_lon):
+        """Returns the (lat, lon) path flown by a mission, including the return to launch."""
+        route = [(item.x / 1e7, item.y / 1e7) for item in mission_items if item.x or item.y]
+        route.append((home_lat, home_lon))
+        return route
+
+    def run_preflight_checks(self, distance):
+        """Evaluates all pre-flight checks from cached telemetry and returns the failures."""
+        checks = [
+            self.check_gps_fix,
+            lambda: self.check_battery(distance),
+            self.check_ekf_status,
+            self.check_geofence,
+            self.check_prearm_status,
+        ]
+        failures = []
+        for check in checks:
+            try:
+                failure = check()
+            except Exception as e:
+                failure = f"check raised {str(e)}"
+            if failure:
+                failures.append(failure)
+        return failures
+
+    def check_gps_fix(self):
+        """Requires a 3D GPS fix with enough satellites."""
+        gps = self.get_cached_message('GPS_RAW_INT')
+        if gps is None:
+            return "no recent GPS_RAW_INT telemetry"
+        if gps.fix_type < mavutil.mavlink.GPS_FIX_TYPE_3D_FIX:
+            return f"GPS fix type {gps.fix_type} is below 3D fix"
+        if gps.satellites_visible < MIN_GPS_SATELLITES:
+            return f"only {gps.satellites_visible} GPS satellites visible (need {MIN_GPS_SATELLITES})"
+        return None
+
+    def check_battery(self, distance):
+        """Requires enough battery for the round trip plus the reserve."""
+        status = self.get_cached_message('SYS_STATUS')
+        if status is None:
+            return "no recent SYS_STATUS telemetry"
+        if status.battery_remaining < 0:
+            return "battery level unknown"
+        required = BATTERY_RESERVE_PERCENT + BATTERY_PERCENT_PER_KM * (2 * distance / 1000.0)
+        if status.battery_remaining < required:
+            return f"battery at {status.battery_remaining}% but round trip needs {required:.0f}%"
+        return None
+
+    def check_ekf_status(self):
+        """Requires a healthy EKF attitude, velocity and absolute position solution."""
+        if EKF_REQUIRED_FLAGS is None:
+            return None
+        ekf = self.get_cached_message('EKF_STATUS_REPORT')
+        if ekf is None:
+            return "no recent EKF_STATUS_REPORT telemetry"
+        if ekf.flags & EKF_REQUIRED_FLAGS != EKF_REQUIRED_FLAGS:
+            return f"EKF solution incomplete (flags {ekf.flags:#x})"
+        return None
+
+    def check_geofence(self):
+        """Requires the drone to be outside local no-fly zones and the onboard geofence to be healthy."""
+        if self.geofence_breach:
+            return f"drone is inside no-fly zone {self.geofence_breach}"
+        return self.check_sensor_health(mavutil.mavlink.MAV_SYS_STATUS_GEOFENCE, "geofence breached")
+
+    def check_prearm_status(self):
+        """Requires the autopilot's own pre-arm checks to pass."""
+        return self.check_sensor_health(mavutil.mavlink.MAV_SYS_STATUS_PREARM_CHECK, "autopilot pre-arm checks failing")
+
+    def check_sensor_health(self, sensor_bit, failure_message):
+        """Checks a SYS_STATUS sensor bit, ignoring sensors that are not enabled."""
+        status = self.get_cached_message('SYS_STATUS')
+        if status is None:
+            return "no recent SYS_STATUS telemetry"
+        if status.onboard_control_sensors_enabled & sensor_bit and not status.onboard_control_sensors_health & sensor_bit:
+            return failure_message
+        return None
+
+    def create_mission_item(self, seq, command, lat=0, lon=0, alt=0, params=(0, 0, 0, 0),
+                            frame=mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+                            mission_type=mavutil.mavlink.MAV_MISSION_TYPE_MISSION):
         """Creates a MAVLink mission item."""
         return mavutil.mavlink.MAVLink_mission_item_int_message(
             self.master.target_system, self.master.target_component,
-            seq, mavutil.mavlink.MAV_FRAME_GLOBAL_RELATIVE_ALT,
+            seq, frame,
             command, 0, 1, *params,
             int(lat * 1e7), int(lon * 1e7), alt,
-            mavutil.mavlink.MAV_MISSION_TYPE_MISSION
+            mission_type
         )
 
-    def upload_mission(self, mission_items):
+    def upload_fences(self):
+        """Uploads the no-fly zones to the vehicle as exclusion polygons of the fence mission type."""
+        if not self.connection_established.is_set():
+            raise ConnectionError("No connection to the drone")
+        fence_items = []
+        for polygon in self.geofence.exclusion_polygons():
+            for lat, lon in polygon:
+                fence_items.append(self.create_mission_item(
+                    len(fence_items), mavutil.mavlink.MAV_CMD_NAV_FENCE_POLYGON_VERTEX_EXCLUSION, lat, lon,
+                    params=(len(polygon), 0, 0, 0), frame=mavutil.mavlink.MAV_FRAME_GLOBAL,
+                    mission_type=mavutil.mavlink.MAV_MISSION_TYPE_FENCE
+                ))
+        with self.connection_lock:
+            if fence_items:
+                self.upload_mission(fence_items, mission_type=mavutil.mavlink.MAV_MISSION_TYPE_FENCE)
+            else:
+                self.master.mav.mission_clear_all_send(self.master.target_system, self.master.target_component,
+                                                       mavutil.mavlink.MAV_MISSION_TYPE_FENCE)
+        return len(fence_items)
+
+    def upload_mission(self, mission_items, mission_type=mavutil.mavlink.MAV_MISSION_TYPE_MISSION):
         """Uploads mission items to the drone."""
-        self.master.mav.mission_count_send(self.master.target_system, self.master.target_component, len(mission_items))
+        self.master.mav.mission_count_send(self.master.target_system, self.master.target_component, len(mission_items), mission_type)
         for i, item in enumerate(mission_items):
             self.wait_for_mission_request(i)
             self.master.mav.send(item)
 
-        if not self.master.recv_match(type='MISSION_ACK', blocking=True, timeout=10):
+        ack = self.master.recv_match(type='MISSION_ACK', blocking=True, timeout=10)
+        if not ack:
             raise TimeoutError("Did not receive MISSION_ACK")
+        if ack.type != mavutil.mavlink.MAV_MISSION_ACCEPTED:
+            raise RuntimeError(f"Mission upload rejected with result {ack.type}")
+        if mission_type == mavutil.mavlink.MAV_MISSION_TYPE_MISSION:
+            self.onboard_mission = [self.mission_item_to_dict(item) for item in mission_items]
+
+    def clear_mission(self):
+        """Clears the onboard mission."""
+        self.master.mav.mission_clear_all_send(self.master.target_system, self.master.target_component)
+        self.onboard_mission = None
+
+    def download_mission(self, timeout=10, retries=3):
+        """Downloads the onboard mission (MISSION_REQUEST_LIST / MISSION_ITEM_INT) and caches it."""
+        if not self.connection_established.is_set():
+            raise ConnectionError("No connection to the drone")
+        with self.connection_lock:
+            return self.fetch_mission(timeout, retries)
+
+    def fetch_mission(self, timeout=10, retries=3):
+        """Runs the mission download exchange; the caller must hold connection_lock."""
+        self.master.mav.mission_request_list_send(self.master.target_system, self.master.target_component)
+        count = self.master.recv_match(type='MISSION_COUNT', blocking=True, timeout=timeout)
+        if not count:
+            raise TimeoutError("Did not receive MISSION_COUNT")
+
+        items = []
+        for seq in range(count.count):
+            for _ in range(retries):
+                self.master.mav.mission_request_int_send(self.master.target_system, self.master.target_component, seq)
+                item = self.wait_for_mission_item(seq, timeout)
+                if item:
+                    items.append(self.mission_item_to_dict(item))
+                    break
+            else:
+                raise TimeoutError(f"Timeout waiting for mission item {seq}")
+        self.master.mav.mission_ack_send(self.master.target_system, self.master.target_component,
+                                         mavutil.mavlink.MAV_MISSION_ACCEPTED)
+        self.onboard_mission = items
+        return items
+
+    def get_onboard_mission(self, refresh=False):
+        """Returns the onboard mission, downloading it only when the cache is empty or refresh is requested."""
+        mission = self.onboard_mission
+        if mission is None or refresh:
+            mission = self.download_mission()
+        return mission
+
+    def mission_matches_onboard(self, mission_items):
+        """Checks whether the vehicle already holds the items about to be uploaded.
+
+        The cache only decides whether a check is worthwhile: another ground station
+        may have replaced the mission unseen, so a match is confirmed against a fresh
+        download. The caller must hold connection_lock. Item 0 is excluded because
+        ArduPilot replaces it with the home position.
+        """
+        expected = [self.mission_item_to_dict(item) for item in mission_items[1:]]
+        onboard = self.onboard_mission
+        if onboard is None or len(onboard) != len(mission_items) or onboard[1:] != expected:
+            return False
+        try:
+            onboard = self.fetch_mission()
+        except Exception as e:
+            # Failing to verify only costs an upload
+            self.logger.warning("Could not verify onboard mission: %s", e)
+            return False
+        return len(onboard) == len(mission_items) and onboard[1:] == expected
+
+    def mission_item_to_dict(self, item):
+        """Converts a MISSION_ITEM_INT message into a comparable, JSON-serialisable dict."""
+        return {
+            "seq": item.seq, "frame": item.frame, "command": item.command,
+            "params": [item.param1, item.param2, item.param3, item.param4],
+            "latitude": item.x / 1e7, "longitude": item.y / 1e7, "altitude": round(item.z, 3),
+        }
 
     def set_mode_and_arm(self):
         """Sets the drone mode to GUIDED and arms it."""
@@ -150,6 +612,15 @@ class DroneController:
                 return message.result == mavutil.mavlink.MAV_RESULT_ACCEPTED
         raise TimeoutError(f"Timeout waiting for acknowledgment of command {command}")
 
+    def wait_for_mission_item(self, seq, timeout=10):
+        """Waits for the mission item with the given sequence number, returning None on timeout."""
+        start_time = time.time()
+        while time.time() - start_time < timeout:
+            message = self.master.recv_match(type='MISSION_ITEM_INT', blocking=True, timeout=1)
+            if message and message.seq == seq:
+                return message
+        return None
+
     def wait_for_mission_request(self, seq, timeout=10):
         """Waits for mission request."""
         start_time = time.time()
@@ -159,12 +630,66 @@ class DroneController:
                 return message.seq
         raise TimeoutError("Timeout waiting for mission request")
 
+class DispatchEntry:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.completed = None  # time the outcome was recorded; the TTL runs from here
+        self.done = threading.Event()
+        self.response = None
+
+
+class DispatchCache:
+    """TTL-bounded cache of dispatch outcomes keyed by client idempotency key."""
+
+    def __init__(self, ttl=IDEMPOTENCY_TTL, max_entries=IDEMPOTENCY_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def claim(self, key, fingerprint):
+        """Returns the entry for a key and whether the caller owns (must run) the dispatch."""
+        with self.lock:
+            self.evict()
+            entry = self.entries.get(key)
+            if entry is not None:
+                return entry, False
+            entry = DispatchEntry(fingerprint)
+            self.entries[key] = entry
+            return entry, True
+
+    def complete(self, entry, response):
+        """Records the outcome of a dispatch and releases any joined duplicates."""
+        entry.response = response
+        entry.completed = time.time()
+        entry.done.set()
+
+    def discard(self, key, entry, response):
+        """Releases joined duplicates with a response that must not be replayed, and forgets the key."""
+        with self.lock:
+            if self.entries.get(key) is entry:
+                del self.entries[key]
+        entry.response = response
+        entry.done.set()
+
+    def evict(self):
+        """Drops expired entries, and the oldest finished ones beyond the size bound."""
+        now = time.time()
+        for key, entry in list(self.entries.items()):
+            if entry.done.is_set() and (now - entry.completed > self.ttl or len(self.entries) > self.max_entries):
+                del self.entries[key]
+
 class DroneAPI:
-    def __init__(self, connection_string, drone_id):
-        self.drone_controller = DroneController(connection_string, drone_id)
+    def __init__(self, connection_string, drone_id, geofence_path=None, site=None, history_db=None):
+        started = time.perf_counter()
+        self.mission_store = MissionStore(history_db) if history_db else None
+        self.drone_controller = DroneController(connection_string, drone_id, geofence_path, site, self.mission_store)
+        self.drone_controller.phase_timings["imports"] = round(started - STARTUP_TIME, 4)
+        self.dispatch_cache = DispatchCache()
         self.app = Flask(__name__)
         CORS(self.app)
         self.setup_routes()
+        self.drone_controller.record_phase("app_setup", started)
 
     def setup_routes(self):
         @self.app.route('/drone_info', methods=['GET'])
@@ -178,34 +703,148 @@ class DroneAPI:
                 lat, lon , alt = 0, 0, 0
                 return jsonify({"drone_id": self.drone_controller.drone_id, "latitude": lat, "longitude": lon, "altitude": alt}), 200
             except Exception as e:
-                logger.error(f"Error getting drone information: {str(e)}")
+                self.drone_controller.logger.error("Error getting drone information: %s", e)
                 return jsonify({"error": f"Failed to get drone information: {str(e)}"}), 500
 
         @self.app.route('/drop_coordinates', methods=['POST'])
         def receive_coordinates():
             """Receives drop coordinates and executes a mission."""
-            if not self.drone_controller.connection_established.is_set():
-                return jsonify({"error": "No connection to the drone. Retry connection."}), 503
-
-            data = request.json
-            if not data or data.get('drone_id') != self.drone_controller.drone_id:
+            data = request.get_json(silent=True)
+            if not isinstance(data, dict):
+                return jsonify({"error": "Request body must be a JSON object."}), 400
+            if data.get('drone_id') != self.drone_controller.drone_id:
                 return jsonify({"error": f"Invalid drone ID. Expected {self.drone_controller.drone_id}. Got {data.get('drone_id')}"}), 400
 
             try:
                 drop_lat, drop_lon = float(data['latitude']), float(data['longitude'])
-                if not (-90 <= drop_lat <= 90) or not (-180 <= drop_lon <= 180):
-                    return jsonify({"error": "Invalid latitude/longitude range."}), 400
-
-                success, message = self.drone_controller.execute_mission(drop_lat, drop_lon)
-                status = "Mission started" if success else f"Mission execution failed: {message}"
-                return jsonify({"status": status, "latitude": drop_lat, "longitude": drop_lon}), 200 if success else 500
-            except ValueError:
+            except (KeyError, TypeError, ValueError):
                 return jsonify({"error": "Invalid latitude or longitude format."}), 400
+            if not (-90 <= drop_lat <= 90) or not (-180 <= drop_lon <= 180):
+                return jsonify({"error": "Invalid latitude/longitude range."}), 400
+
+            # Retries carrying the same idempotency key replay or join the original dispatch,
+            # even while the link is down
+            idempotency_key = request.headers.get('Idempotency-Key')
+            entry = None
+            if idempotency_key:
+                entry, owner = self.dispatch_cache.claim(idempotency_key, (drop_lat, drop_lon))
+                if not owner:
+                    if entry.fingerprint != (drop_lat, drop_lon):
+                        return jsonify({"error": "Idempotency-Key was already used for different coordinates."}), 409
+                    entry.done.wait()
+                    body, status_code = entry.response
+                    return jsonify(body), status_code, {"Idempotent-Replayed": "true"}
+
+            if not self.drone_controller.connection_established.is_set():
+                unavailable = ({"error": "No connection to the drone. Retry connection."}, 503)
+                if entry:
+                    self.dispatch_cache.discard(idempotency_key, entry, unavailable)
+                return jsonify(unavailable[0]), unavailable[1]
+            if not entry:
+                body, status_code = self.dispatch(drop_lat, drop_lon)
+                return jsonify(body), status_code
+
+            response = ({"error": "Mission dispatch aborted unexpectedly."}, 500)
+            try:
+                response = self.dispatch(drop_lat, drop_lon)
+            finally:
+                self.dispatch_cache.complete(entry, response)
+            return jsonify(response[0]), response[1]
 
         @self.app.route('/connection_status', methods=['GET'])
         def connection_status():
             """Checks drone connection status."""
-            return jsonify({"connected": self.drone_controller.connection_established.is_set()}), 200
+            return jsonify({
+                "connected": self.drone_controller.connection_established.is_set(),
+                "phase": self.drone_controller.connection_phase,
+                "timings": self.drone_controller.phase_timings,
+            }), 200
+
+        @self.app.route('/mission/current', methods=['GET'])
+        def current_mission():
+            """Returns the mission stored on the vehicle, from cache unless refresh=1."""
+            if not self.drone_controller.connection_established.is_set():
+                return jsonify({"error": "No connection to the drone. Retry connection."}), 503
+            refresh = request.args.get('refresh') in ('1', 'true')
+            cached = self.drone_controller.onboard_mission is not None and not refresh
+            try:
+                items = self.drone_controller.get_onboard_mission(refresh)
+                return jsonify({"drone_id": self.drone_controller.drone_id, "cached": cached, "items": items}), 200
+            except Exception as e:
+                self.drone_controller.logger.error("Error downloading mission: %s", e)
+                return jsonify({"error": f"Failed to download mission: {str(e)}"}), 500
+
+        @self.app.route('/missions', methods=['GET'])
+        def list_missions():
+            """Lists recorded dispatches, newest first, filtered by drone, time range and area."""
+            if not self.mission_store:
+                return jsonify({"error": "Mission history is disabled."}), 404
+            args = request.args
+            try:
+                bbox = None
+                if any(key in args for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon')):
+                    bbox = tuple(float(args[key]) for key in ('min_lat', 'min_lon', 'max_lat', 'max_lon'))
+                since = float(args['since']) if 'since' in args else None
+                until = float(args['until']) if 'until' in args else None
+                limit = int(args['limit']) if 'limit' in args else DEFAULT_PAGE_SIZE
+                missions, next_cursor = self.mission_store.list_missions(
+                    drone_id=args.get('drone_id'),
+                    since=since,
+                    until=until,
+                    bbox=bbox,
+                    cursor=args.get('cursor'),
+                    limit=limit,
+                )
+            except (KeyError, ValueError):
+                return jsonify({"error": "Invalid query parameters."}), 400
+            return jsonify({"missions": missions, "next_cursor": next_cursor}), 200
+
+        @self.app.route('/geofence', methods=['GET'])
+        def get_geofence():
+            """Lists the loaded geofence zones."""
+            return jsonify({**self.drone_controller.geofence.summary(), "breach": self.drone_controller.geofence_breach}), 200
+
+        @self.app.route('/geofence/reload', methods=['POST'])
+        def reload_geofence():
+            """Reloads the geofence GeoJSON file."""
+            geofence = self.drone_controller.geofence
+            if not geofence.path:
+                return jsonify({"error": "No geofence file configured."}), 400
+            if not geofence.reload():
+                return jsonify({"error": "Failed to load geofence file; previous zones kept."}), 500
+            return jsonify({"zones": len(geofence.fences.zones)}), 200
+
+        @self.app.route('/geofence/upload', methods=['POST'])
+        def upload_geofence():
+            """Uploads the no-fly zones to the vehicle's fence."""
+            if not self.drone_controller.connection_established.is_set():
+                return jsonify({"error": "No connection to the drone. Retry connection."}), 503
+            try:
+                vertices = self.drone_controller.upload_fences()
+                return jsonify({"status": "Fence uploaded", "vertices": vertices}), 200
+            except Exception as e:
+                self.drone_controller.logger.error("Error uploading fence: %s", e)
+                return jsonify({"error": f"Failed to upload fence: {str(e)}"}), 500
+
+    def dispatch(self, drop_lat, drop_lon):
+        """Executes a mission and returns the response body and status code."""
+        mission_id = uuid.uuid4().hex
+        timings = {}
+        created_at = time.time()
+        started = time.perf_counter()
+        success, message = self.drone_controller.execute_mission(drop_lat, drop_lon, timings)
+        dispatch_duration = elapsed(started)
+        if success:
+            self.drone_controller.track_flight(mission_id)
+        if self.mission_store:
+            self.mission_store.record_dispatch(mission_id, self.drone_controller.drone_id, created_at, drop_lat, drop_lon,
+                                               success, message, timings, dispatch_duration)
+        status = "Mission started" if success else f"Mission execution failed: {message}"
+        self.drone_controller.logger.info("Dispatch finished", extra={
+            "mission_id": mission_id, "drop_latitude": drop_lat, "drop_longitude": drop_lon,
+            "success": success, "timings": timings,
+        })
+        return {"status": status, "mission_id": mission_id, "latitude": drop_lat, "longitude": drop_lon}, 200 if success else 500
 
     def find_available_port(self, start_port):
         """Finds the next available port starting from the given port number."""
@@ -217,10 +856,15 @@ class DroneAPI:
                 port += 1
 
     def run(self, debug=False, port=5000):
-        """Runs the Flask app, finding an available port if necessary."""
-        self.drone_controller.initialize_connection()
+        """Runs the Flask app, finding an available port if necessary.
+
+        The MAVLink link comes up in the background so the HTTP port is bound
+        immediately; routes report 503 until the heartbeat arrives.
+        """
+        self.drone_controller.connect_in_background()
         available_port = self.find_available_port(port)
-        logger.info(f"Starting Flask server on port: {available_port}")
+        self.drone_controller.phase_timings["http_start"] = elapsed(STARTUP_TIME)
+        self.drone_controller.logger.info("Starting Flask server on port: %d", available_port)
         self.app.run(host="0.0.0.0", debug=debug, port=available_port)
 
 if __name__ == '__main__':
@@ -237,19 +881,35 @@ if __name__ == '__main__':
                        help='Port for the Flask server')
     parser.add_argument('--debug', action='store_true',
                        help='Run Flask in debug mode')
+    parser.add_argument('--geofence', type=str,
+                       default=None,
+                       help='GeoJSON file of no-fly and delivery zones (reloaded when it changes)')
+    parser.add_argument('--site', type=str,
+                       default=None,
+                       help='Site whose delivery zones restrict drop coordinates')
+    parser.add_argument('--history-db', type=str,
+                       default='missions.db',
+                       help='SQLite file for mission history (empty string disables it)')
 
     args = parser.parse_args()
 
     # Log the configuration
-    logger.info(f"Starting drone controller with:")
-    logger.info(f"Connection string: {args.connection}")
-    logger.info(f"Drone ID: {args.drone_id}")
-    logger.info(f"Server port: {args.port}")
-    logger.info(f"Debug mode: {args.debug}")
+    logger.info("Starting drone controller", extra={
+        "connection": args.connection,
+        "drone_id": args.drone_id,
+        "port": args.port,
+        "debug": args.debug,
+        "geofence": args.geofence,
+        "site": args.site,
+        "history_db": args.history_db,
+    })
+
+    # Exit through SystemExit on SIGTERM so atexit handlers flush logs and mission history
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
     try:
-        api = DroneAPI(args.connection, args.drone_id)
+        api = DroneAPI(args.connection, args.drone_id, args.geofence, args.site, args.history_db)
         api.run(debug=args.debug, port=args.port)
     except Exception as e:
-        logger.error(f"Failed to start drone controller: {str(e)}")
+        logger.error("Failed to start drone controller: %s", e)
         exit(1)
\ No newline at end of file
@@ -0,0 +1,252 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Constants
+GRID_CELL_SIZE = 0.01  # degrees (~1.1 km of latitude) per spatial index cell
+MAX_INDEXED_CELLS = 2500  # polygons covering more cells are checked without the grid
+RELOAD_CHECK_INTERVAL = 2  # seconds between checks of the GeoJSON file's mtime
+
+NO_FLY = "no_fly"
+DELIVERY_ZONE = "delivery_zone"
+ZONE_KINDS = (NO_FLY, DELIVERY_ZONE)
+
+
+def point_in_ring(x, y, ring):
+    """Ray-casting test of a point against a closed ring of (x, y) vertices."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+def segments_intersect(p1, p2, q1, q2):
+    """Returns True if segment p1-p2 intersects segment q1-q2 (including touching)."""
+    def orientation(a, b, c):
+        value = (b[1] - a[1]) * (c[0] - b[0]) - (b[0] - a[0]) * (c[1] - b[1])
+        return 0 if value == 0 else (1 if value > 0 else 2)
+
+    def on_segment(a, b, c):
+        return min(a[0], c[0]) <= b[0] <= max(a[0], c[0]) and min(a[1], c[1]) <= b[1] <= max(a[1], c[1])
+
+    o1, o2 = orientation(p1, p2, q1), orientation(p1, p2, q2)
+    o3, o4 = orientation(q1, q2, p1), orientation(q1, q2, p2)
+    if o1 != o2 and o3 != o4:
+        return True
+    return ((o1 == 0 and on_segment(p1, q1, p2)) or (o2 == 0 and on_segment(p1, q2, p2))
+            or (o3 == 0 and on_segment(q1, p1, q2)) or (o4 == 0 and on_segment(q1, p2, q2)))
+
+
+class Zone:
+    """A single polygon (outer ring plus holes) in (lon, lat) coordinates."""
+
+    def __init__(self, name, kind, site, rings):
+        self.name = name
+        self.kind = kind
+        self.site = site
+        self.rings = rings
+        xs = [x for x, _ in rings[0]]
+        ys = [y for _, y in rings[0]]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def bbox_contains(self, x, y):
+        return self.bbox[0] <= x <= self.bbox[2] and self.bbox[1] <= y <= self.bbox[3]
+
+    def bbox_overlaps(self, bbox):
+        return not (bbox[2] < self.bbox[0] or bbox[0] > self.bbox[2] or bbox[3] < self.bbox[1] or bbox[1] > self.bbox[3])
+
+    def contains(self, x, y):
+        """Checks whether the point lies inside the outer ring and outside every hole."""
+        if not self.bbox_contains(x, y) or not point_in_ring(x, y, self.rings[0]):
+            return False
+        return not any(point_in_ring(x, y, hole) for hole in self.rings[1:])
+
+    def intersects_segment(self, a, b):
+        """Checks whether the segment a-b enters the polygon."""
+        if self.contains(*a) or self.contains(*b):
+            return True
+        for ring in self.rings:
+            for i in range(len(ring) - 1):
+                if segments_intersect(a, b, ring[i], ring[i + 1]):
+                    return True
+        return False
+
+    def to_summary(self):
+        return {"name": self.name, "kind": self.kind, "site": self.site, "bbox": self.bbox}
+
+
+class GridIndex:
+    """Uniform grid over polygon bounding boxes, built once per loaded fence set."""
+
+    def __init__(self, zones, cell_size=GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.unindexed = []  # zones too large to register cell by cell
+        for zone in zones:
+            x0, y0, x1, y1 = self.cell_range(zone.bbox)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > MAX_INDEXED_CELLS:
+                self.unindexed.append(zone)
+                continue
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    self.cells.setdefault((cx, cy), []).append(zone)
+
+    def cell_range(self, bbox):
+        return (math.floor(bbox[0] / self.cell_size), math.floor(bbox[1] / self.cell_size),
+                math.floor(bbox[2] / self.cell_size), math.floor(bbox[3] / self.cell_size))
+
+    def candidates_at(self, x, y):
+        """Returns zones whose bounding box may contain the point."""
+        cell = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+        return self.cells.get(cell, []) + self.unindexed
+
+    def candidates_in(self, bbox):
+        """Returns the distinct zones whose bounding box may overlap the given box."""
+        x0, y0, x1, y1 = self.cell_range(bbox)
+        found = {id(zone): zone for zone in self.unindexed}
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                for zone in self.cells.get((cx, cy), ()):
+                    found[id(zone)] = zone
+        return list(found.values())
+
+
+class FenceSet:
+    """Immutable snapshot of loaded zones with their spatial indexes."""
+
+    def __init__(self, zones):
+        self.zones = zones
+        self.no_fly_index = GridIndex([zone for zone in zones if zone.kind == NO_FLY])
+        self.delivery_index = GridIndex([zone for zone in zones if zone.kind == DELIVERY_ZONE])
+        self.delivery_sites = {zone.site for zone in zones if zone.kind == DELIVERY_ZONE}
+
+
+class GeofenceStore:
+    """Operator-managed no-fly zones and delivery zones loaded from a GeoJSON file.
+
+    Each loaded file is parsed into an immutable snapshot (zones plus grid index)
+    that replaces the previous one atomically, so queries never take a lock. A
+    watcher thread picks up file changes, keeping parsing off the query paths.
+    """
+
+    def __init__(self, path=None, site=None):
+        self.path = path
+        self.site = site
+        self.reload_lock = threading.Lock()
+        self.mtime = None
+        self.fences = FenceSet([])
+        if path:
+            self.reload()
+            threading.Thread(target=self.watch, name="geofence-watcher", daemon=True).start()
+
+    def reload(self):
+        """Loads the GeoJSON file, keeping the previous fences if it is invalid."""
+        with self.reload_lock:
+            try:
+                mtime = os.path.getmtime(self.path)
+                with open(self.path) as f:
+                    zones = self.parse(json.load(f))
+            except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+                logger.error("Failed to load geofences from %s: %s", self.path, e)
+                return False
+            fences = FenceSet(zones)
+            self.fences = fences
+            self.mtime = mtime
+            logger.info("Loaded %d geofence zones", len(zones), extra={"path": self.path})
+            if self.site is not None and fences.delivery_sites and self.site not in fences.delivery_sites:
+                logger.error("Site %s has no delivery zones; all drops will be rejected", self.site)
+            return True
+
+    def watch(self):
+        """Watcher loop: reloads the file whenever its mtime changes."""
+        while True:
+            time.sleep(RELOAD_CHECK_INTERVAL)
+            try:
+                changed = os.path.getmtime(self.path) != self.mtime
+            except OSError:
+                continue
+            if changed:
+                self.reload()
+
+    def parse(self, geojson):
+        """Parses a FeatureCollection of Polygon/MultiPolygon features into zones."""
+        zones = []
+        for i, feature in enumerate(geojson['features']):
+            properties = feature.get('properties') or {}
+            kind = properties.get('kind', NO_FLY)
+            if kind not in ZONE_KINDS:
+                raise ValueError(f"Feature {i} has unknown kind {kind!r}")
+            name = properties.get('name', f"zone-{i}")
+            geometry = feature['geometry']
+            if geometry['type'] == 'Polygon':
+                polygons = [geometry['coordinates']]
+            elif geometry['type'] == 'MultiPolygon':
+                polygons = geometry['coordinates']
+            else:
+                raise ValueError(f"Feature {i} has unsupported geometry {geometry['type']}")
+            for polygon in polygons:
+                rings = [[(float(x), float(y)) for x, y, *_ in ring] for ring in polygon]
+                for ring in rings:
+                    if ring[0] != ring[-1]:
+                        ring.append(ring[0])
+                zones.append(Zone(name, kind, properties.get('site'), rings))
+        return zones
+
+    def no_fly_zone_at(self, lat, lon):
+        """Returns the no-fly zone containing the point, or None."""
+        for zone in self.fences.no_fly_index.candidates_at(lon, lat):
+            if zone.contains(lon, lat):
+                return zone
+        return None
+
+    def in_delivery_zone(self, lat, lon):
+        """Checks the point against the configured site's delivery zones.
+
+        True when no delivery zones are defined at all; fails closed when the
+        site has none, since that usually means a misnamed site.
+        """
+        fences = self.fences
+        if not fences.delivery_sites:
+            return True
+        if self.site is not None and self.site not in fences.delivery_sites:
+            return False
+        return any(zone.contains(lon, lat) for zone in fences.delivery_index.candidates_at(lon, lat)
+                   if self.site is None or zone.site == self.site)
+
+    def no_fly_zone_on_segment(self, start, end):
+        """Returns the first no-fly zone crossed by the (lat, lon) segment start-end, or None."""
+        a, b = (start[1], start[0]), (end[1], end[0])
+        bbox = (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+        for zone in self.fences.no_fly_index.candidates_in(bbox):
+            if zone.bbox_overlaps(bbox) and zone.intersects_segment(a, b):
+                return zone
+        return None
+
+    def check_route(self, waypoints):
+        """Returns a violation message for a route of (lat, lon) waypoints, or None."""
+        for lat, lon in waypoints:
+            zone = self.no_fly_zone_at(lat, lon)
+            if zone:
+                return f"Waypoint ({lat}, {lon}) is inside no-fly zone {zone.name}"
+        for start, end in zip(waypoints, waypoints[1:]):
+            zone = self.no_fly_zone_on_segment(start, end)
+            if zone:
+                return f"Route segment {start} -> {end} crosses no-fly zone {zone.name}"
+        return None
+
+    def exclusion_polygons(self):
+        """Returns the outer ring of every no-fly zone as (lat, lon) vertices, unclosed."""
+        return [[(y, x) for x, y in zone.rings[0][:-1]] for zone in self.fences.zones if zone.kind == NO_FLY]
+
+    def summary(self):
+        return {"path": self.path, "zones": [zone.to_summary() for zone in self.fences.zones]}
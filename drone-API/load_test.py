@@ -0,0 +1,374 @@
+import argparse
+import json
+import logging
+import math
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Imported first so its MAVLink 2 selection applies to pymavlink
+from drone_delivery import DroneAPI, EARTH_RADIUS
+from flask import has_request_context, request
+from pymavlink import mavutil
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+# Constants
+HOME_LAT = -35.3632
+HOME_LON = 149.1652
+HOME_ALT = 584.0
+TELEMETRY_RATE = 5  # Hz of simulated telemetry per vehicle
+SIMULATED_FLIGHT_TIME = 5  # seconds a simulated vehicle stays armed after arming
+DROP_RADIUS = 500  # meters around home in which drop coordinates are generated
+CONNECT_TIMEOUT = 30  # seconds to wait for every API to reach its vehicle
+READ_ROUTES = ('/drone_info', '/connection_status')
+# DroneController thread-name prefixes, used to attribute connection_lock waits
+LOCK_ROLES = (('telemetry-', 'telemetry pump'), ('connect-', 'connect'))
+
+
+def free_port():
+    """Returns a TCP port that is currently free on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class SimulatedVehicle:
+    """Minimal ArduCopter stand-in: streams telemetry and answers mission and command traffic."""
+
+    def __init__(self, port):
+        self.port = port
+        self.mission = []
+        self.expected_count = 0
+        self.armed_until = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name=f"vehicle-{port}", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        conn = mavutil.mavlink_connection(f'tcpin:127.0.0.1:{self.port}', source_system=1)
+        started = time.time()
+        last_telemetry = 0
+        while not self.stopped.is_set():
+            now = time.time()
+            if now - last_telemetry >= 1.0 / TELEMETRY_RATE:
+                last_telemetry = now
+                try:
+                    self.send_telemetry(conn, now - started, now < self.armed_until)
+                except OSError:
+                    pass  # no ground station connected yet
+            message = conn.recv_match(blocking=True, timeout=0.02)
+            if message is not None:
+                self.handle(conn, message)
+
+    def send_telemetry(self, conn, uptime, armed):
+        mavlink = mavutil.mavlink
+        lat, lon = int(HOME_LAT * 1e7), int(HOME_LON * 1e7)
+        base_mode = mavlink.MAV_MODE_FLAG_SAFETY_ARMED if armed else 0
+        conn.mav.heartbeat_send(mavlink.MAV_TYPE_QUADROTOR, mavlink.MAV_AUTOPILOT_ARDUPILOTMEGA,
+                                base_mode, 4, mavlink.MAV_STATE_ACTIVE if armed else mavlink.MAV_STATE_STANDBY)
+        conn.mav.global_position_int_send(int(uptime * 1000) & 0xffffffff, lat, lon, int(HOME_ALT * 1000), 0, 0, 0, 0, 0)
+        conn.mav.gps_raw_int_send(int(uptime * 1e6), mavlink.GPS_FIX_TYPE_3D_FIX, lat, lon, int(HOME_ALT * 1000),
+                                  100, 100, 0, 0, 12)
+        sensors = mavlink.MAV_SYS_STATUS_PREARM_CHECK
+        conn.mav.sys_status_send(sensors, sensors, sensors, 0, 12600, 0, 95, 0, 0, 0, 0, 0, 0)
+        conn.mav.ekf_status_report_send(0x1ff, 0.1, 0.1, 0.1, 0.1, 0.1)
+
+    def handle(self, conn, message):
+        mavlink = mavutil.mavlink
+        message_type = message.get_type()
+        if message_type == 'MISSION_COUNT':
+            self.expected_count = message.count
+            self.mission = []
+            conn.mav.mission_request_int_send(255, 0, 0, message.mission_type)
+        elif message_type == 'MISSION_ITEM_INT':
+            self.mission.append(message)
+            if len(self.mission) < self.expected_count:
+                conn.mav.mission_request_int_send(255, 0, len(self.mission), message.mission_type)
+            else:
+                conn.mav.mission_ack_send(255, 0, mavlink.MAV_MISSION_ACCEPTED, message.mission_type)
+        elif message_type == 'MISSION_REQUEST_LIST':
+            conn.mav.mission_count_send(255, 0, len(self.mission))
+        elif message_type == 'MISSION_REQUEST_INT' and message.seq < len(self.mission):
+            item = self.mission[message.seq]
+            conn.mav.mission_item_int_send(255, 0, item.seq, item.frame, item.command, 0, 1,
+                                           item.param1, item.param2, item.param3, item.param4, item.x, item.y, item.z)
+        elif message_type == 'MISSION_CLEAR_ALL':
+            if message.mission_type == mavlink.MAV_MISSION_TYPE_MISSION:
+                self.mission = []
+        elif message_type == 'COMMAND_LONG':
+            if message.command == mavlink.MAV_CMD_COMPONENT_ARM_DISARM and message.param1 == 1:
+                self.armed_until = time.time() + SIMULATED_FLIGHT_TIME
+            conn.mav.command_ack_send(message.command, mavlink.MAV_RESULT_ACCEPTED)
+        elif message_type == 'SET_MODE':
+            conn.mav.command_ack_send(mavlink.MAV_CMD_DO_SET_MODE, mavlink.MAV_RESULT_ACCEPTED)
+
+
+def lock_role():
+    """Names the current lock acquirer: the HTTP route it serves, or its controller thread."""
+    if has_request_context():
+        return request.path
+    name = threading.current_thread().name
+    for prefix, role in LOCK_ROLES:
+        if name.startswith(prefix):
+            return role
+    return 'other'
+
+
+class TimedLock:
+    """Drop-in replacement for threading.Lock that records acquirer waits per role."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.waits = {}  # role -> list of waits in seconds
+
+    def acquire(self, blocking=True, timeout=-1):
+        started = time.perf_counter()
+        acquired = self.lock.acquire(blocking, timeout)
+        wait = time.perf_counter() - started
+        role = lock_role()
+        with self.stats_lock:
+            self.waits.setdefault(role, []).append(wait)
+        return acquired
+
+    def release(self):
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class ApiInstance:
+    """A DroneAPI served by a threaded WSGI server, connected to one simulated vehicle."""
+
+    def __init__(self, index):
+        self.drone_id = f"LOAD_{index:03d}"
+        self.vehicle = SimulatedVehicle(free_port())
+        self.api = DroneAPI(f'tcp:127.0.0.1:{self.vehicle.port}', self.drone_id)
+        self.lock = TimedLock()
+        self.api.drone_controller.connection_lock = self.lock
+        self.server = make_server('127.0.0.1', 0, self.api.app, threaded=True)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.vehicle.start()
+        self.api.drone_controller.connect_in_background()
+        threading.Thread(target=self.server.serve_forever, name=f"http-{self.drone_id}", daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.vehicle.stop()
+
+    def connected(self):
+        return self.api.drone_controller.connection_established.is_set()
+
+
+class RouteStats:
+    """Latencies and outcomes collected for one route."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.statuses = {}
+        self.errors = 0
+
+    def record(self, latency, status):
+        with self.lock:
+            self.latencies.append(latency)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            if not isinstance(status, int) or status >= 400:
+                self.errors += 1
+
+    def summary(self, duration):
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        to_ms = lambda value: None if value is None else round(value * 1000, 2)
+        return {
+            "requests": count,
+            "throughput": round(count / duration, 2),
+            "error_rate": round(self.errors / count, 4) if count else 0,
+            "p50_ms": to_ms(percentile(latencies, 0.50)),
+            "p95_ms": to_ms(percentile(latencies, 0.95)),
+            "p99_ms": to_ms(percentile(latencies, 0.99)),
+            "max_ms": to_ms(latencies[-1] if latencies else None),
+            "statuses": {str(status): n for status, n in sorted(self.statuses.items(), key=str)},
+        }
+
+
+class LoadTest:
+    """Drives an open-loop mix of read and dispatch traffic against a set of API instances.
+
+    Requests are issued on a fixed schedule regardless of how fast earlier ones
+    complete, and latency is measured from the scheduled send time, so queueing
+    inside the client pool counts against the server instead of hiding it.
+    """
+
+    def __init__(self, instances, read_rate, dispatch_rate, duration, clients, timeout):
+        self.instances = instances
+        self.read_rate = read_rate
+        self.dispatch_rate = dispatch_rate
+        self.duration = duration
+        self.timeout = timeout
+        self.pool = ThreadPoolExecutor(max_workers=clients, thread_name_prefix="load-client")
+        self.stats = {route: RouteStats() for route in READ_ROUTES + ('/drop_coordinates',)}
+
+    def request(self, scheduled, route, url, body=None):
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        data = json.dumps(body).encode() if body is not None else None
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=self.timeout) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            status = e.code
+        except (urllib.error.URLError, OSError) as e:
+            status = type(e).__name__
+        self.stats[route].record(time.perf_counter() - scheduled, status)
+
+    def random_drop(self):
+        """Returns drop coordinates uniformly within DROP_RADIUS of the simulated home."""
+        distance = DROP_RADIUS * math.sqrt(random.random())
+        bearing = random.uniform(0, 2 * math.pi)
+        lat = HOME_LAT + math.degrees(distance * math.cos(bearing) / EARTH_RADIUS)
+        lon = HOME_LON + math.degrees(distance * math.sin(bearing) / (EARTH_RADIUS * math.cos(math.radians(HOME_LAT))))
+        return lat, lon
+
+    def schedule(self, rate, make_request):
+        """Submits make_request at a fixed rate until the test duration elapses."""
+        if rate <= 0:
+            return
+        interval = 1.0 / rate
+        started = time.perf_counter()
+        next_send = started
+        while next_send - started < self.duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            make_request(next_send)
+            next_send += interval
+
+    def submit_read(self, scheduled):
+        instance = random.choice(self.instances)
+        route = random.choice(READ_ROUTES)
+        self.pool.submit(self.request, scheduled, route, instance.base_url + route)
+
+    def submit_dispatch(self, scheduled):
+        instance = random.choice(self.instances)
+        lat, lon = self.random_drop()
+        body = {"drone_id": instance.drone_id, "latitude": lat, "longitude": lon}
+        self.pool.submit(self.request, scheduled, '/drop_coordinates', instance.base_url + '/drop_coordinates', body)
+
+    def run(self):
+        schedulers = [
+            threading.Thread(target=self.schedule, args=(self.read_rate, self.submit_read), daemon=True),
+            threading.Thread(target=self.schedule, args=(self.dispatch_rate, self.submit_dispatch), daemon=True),
+        ]
+        started = time.perf_counter()
+        for scheduler in schedulers:
+            scheduler.start()
+        for scheduler in schedulers:
+            scheduler.join()
+        self.pool.shutdown(wait=True)
+        elapsed = time.perf_counter() - started
+
+        lock_waits = {}
+        for instance in self.instances:
+            for role, waits in instance.lock.waits.items():
+                lock_waits.setdefault(role, []).extend(waits)
+        return {
+            "duration": round(elapsed, 2),
+            "routes": {route: stats.summary(elapsed) for route, stats in self.stats.items()},
+            "connection_lock": {role: self.wait_summary(sorted(waits)) for role, waits in sorted(lock_waits.items())},
+        }
+
+    def wait_summary(self, waits):
+        to_ms = lambda value: round((value or 0) * 1000, 3)
+        return {
+            "acquisitions": len(waits),
+            "p50_wait_ms": to_ms(percentile(waits, 0.50)),
+            "p95_wait_ms": to_ms(percentile(waits, 0.95)),
+            "p99_wait_ms": to_ms(percentile(waits, 0.99)),
+            "max_wait_ms": to_ms(waits[-1] if waits else None),
+        }
+
+
+def print_report(report):
+    """Prints a per-route latency table followed by connection_lock contention."""
+    print(f"Duration: {report['duration']}s")
+    print(f"{'route':<20}{'reqs':>8}{'req/s':>9}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for route, summary in report['routes'].items():
+        if not summary['requests']:
+            continue
+        print(f"{route:<20}{summary['requests']:>8}{summary['throughput']:>9}{summary['error_rate'] * 100:>8.2f}"
+              f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['max_ms']:>10}")
+        print(f"{'':<20}statuses: {summary['statuses']}")
+    print("connection_lock waits by acquirer:")
+    for role, lock in report['connection_lock'].items():
+        print(f"  {role:<18}{lock['acquisitions']:>8} acquisitions, p50 {lock['p50_wait_ms']} ms, "
+              f"p95 {lock['p95_wait_ms']} ms, p99 {lock['p99_wait_ms']} ms, max {lock['max_wait_ms']} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the drone API against simulated MAVLink vehicles')
+    parser.add_argument('--drones', type=int, default=4,
+                       help='Number of simulated vehicles, each with its own API instance')
+    parser.add_argument('--read-rate', type=float, default=50,
+                       help='Total /drone_info and /connection_status requests per second')
+    parser.add_argument('--dispatch-rate', type=float, default=1,
+                       help='Total /drop_coordinates requests per second')
+    parser.add_argument('--duration', type=float, default=30,
+                       help='Seconds to generate load for')
+    parser.add_argument('--clients', type=int, default=32,
+                       help='Concurrent client connections')
+    parser.add_argument('--timeout', type=float, default=60,
+                       help='Per-request timeout in seconds')
+    parser.add_argument('--json', action='store_true',
+                       help='Print the report as JSON')
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+
+    instances = [ApiInstance(i) for i in range(args.drones)]
+    for instance in instances:
+        instance.start()
+    deadline = time.time() + CONNECT_TIMEOUT
+    while not all(instance.connected() for instance in instances):
+        if time.time() > deadline:
+            logger.error("Timed out waiting for simulated vehicles to connect")
+            exit(1)
+        time.sleep(0.1)
+
+    try:
+        report = LoadTest(instances, args.read_rate, args.dispatch_rate, args.duration, args.clients, args.timeout).run()
+    finally:
+        for instance in instances:
+            instance.stop()
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
@@ -0,0 +1,160 @@
+import atexit
+import contextlib
+import json
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Constants
+FLUSH_INTERVAL = 0.5  # seconds the writer waits to batch more records
+MAX_BATCH_SIZE = 200
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS missions (
+    id TEXT PRIMARY KEY,
+    drone_id TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    drop_lat REAL NOT NULL,
+    drop_lon REAL NOT NULL,
+    success INTEGER NOT NULL,
+    message TEXT,
+    stage_timings TEXT,
+    dispatch_duration REAL,
+    flight_duration REAL
+);
+CREATE INDEX IF NOT EXISTS missions_drone_time ON missions (drone_id, created_at);
+CREATE INDEX IF NOT EXISTS missions_time ON missions (created_at);
+CREATE INDEX IF NOT EXISTS missions_area ON missions (drop_lat, drop_lon);
+"""
+
+INSERT_MISSION = """
+INSERT OR REPLACE INTO missions
+    (id, drone_id, created_at, drop_lat, drop_lon, success, message, stage_timings, dispatch_duration)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+UPDATE_FLIGHT = "UPDATE missions SET flight_duration = ? WHERE id = ?"
+CLOSE = None  # queue sentinel that makes the writer flush and exit
+
+
+class MissionStore:
+    """Durable SQLite (WAL) history of dispatches, written in batches by a background thread.
+
+    `record_dispatch` and `record_flight` only enqueue, so recording never blocks
+    the request path; each query opens its own short-lived read connection, since
+    the HTTP server runs every request on a new thread. `close` (also run at exit)
+    writes everything still queued.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        connection.close()
+        self.writer = threading.Thread(target=self.write_batches, name="mission-store-writer", daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    def close(self):
+        """Flushes queued records and stops the writer thread."""
+        if self.writer.is_alive():
+            self.queue.put(CLOSE)
+            self.writer.join()
+
+    def record_dispatch(self, mission_id, drone_id, created_at, drop_lat, drop_lon, success, message, stage_timings,
+                        dispatch_duration):
+        """Queues a dispatch outcome for writing; created_at is when the dispatch started."""
+        self.queue.put((INSERT_MISSION, (
+            mission_id, drone_id, created_at, drop_lat, drop_lon, int(success), message,
+            json.dumps(stage_timings), dispatch_duration,
+        )))
+
+    def record_flight(self, mission_id, flight_duration):
+        """Queues the flight duration of a finished mission for writing."""
+        self.queue.put((UPDATE_FLIGHT, (flight_duration, mission_id)))
+
+    def write_batches(self):
+        """Writer loop: collects queued statements and commits them in one transaction per batch."""
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA synchronous=NORMAL")
+        closing = False
+        while not closing:
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            while True:
+                if item is CLOSE:
+                    closing = True
+                else:
+                    batch.append(item)
+                remaining = deadline - time.monotonic()
+                if closing or len(batch) >= MAX_BATCH_SIZE or remaining <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if closing:
+                # Drain anything enqueued after the sentinel
+                while True:
+                    try:
+                        item = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not CLOSE:
+                        batch.append(item)
+            if not batch:
+                continue
+            try:
+                with connection:
+                    for statement, params in batch:
+                        connection.execute(statement, params)
+            except sqlite3.Error as e:
+                logger.error("Failed to write %d mission records: %s", len(batch), e)
+        connection.close()
+
+    def list_missions(self, drone_id=None, since=None, until=None, bbox=None, cursor=None, limit=DEFAULT_PAGE_SIZE):
+        """Returns one page of missions, newest first, and the cursor for the next page.
+
+        bbox is (min_lat, min_lon, max_lat, max_lon); cursor is the value returned
+        with the previous page.
+        """
+        clauses, params = [], []
+        if drone_id is not None:
+            clauses.append("drone_id = ?")
+            params.append(drone_id)
+        if since is not None:
+            clauses.append("created_at >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("created_at < ?")
+            params.append(until)
+        if bbox is not None:
+            clauses.append("drop_lat BETWEEN ? AND ? AND drop_lon BETWEEN ? AND ?")
+            params.extend([bbox[0], bbox[2], bbox[1], bbox[3]])
+        if cursor is not None:
+            created_at, mission_id = cursor.split(",", 1)
+            clauses.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([float(created_at), float(created_at), mission_id])
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with contextlib.closing(sqlite3.connect(self.path)) as connection:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                f"SELECT * FROM missions {where} ORDER BY created_at DESC, id DESC LIMIT ?", params + [limit + 1]
+            ).fetchall()
+
+        missions = [dict(row, success=bool(row["success"]), stage_timings=json.loads(row["stage_timings"] or "{}"))
+                    for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = f"{last['created_at']!r},{last['id']}"
+        return missions, next_cursor
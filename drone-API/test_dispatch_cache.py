@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+
+import pytest
+
+from drone_delivery import DispatchCache, DroneAPI
+
+DROP = {"drone_id": "DRONE_TEST", "latitude": -35.363, "longitude": 149.165}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def api():
+    api = DroneAPI("udpin:127.0.0.1:0", DROP["drone_id"])
+    api.dispatches = []
+
+    def dispatch(drop_lat, drop_lon):
+        api.dispatches.append((drop_lat, drop_lon))
+        return {"status": "Mission started", "mission_id": f"m{len(api.dispatches)}"}, 200
+
+    api.dispatch = dispatch
+    api.drone_controller.connection_established.set()
+    return api
+
+
+def post(api, body, key=None):
+    headers = {"Idempotency-Key": key} if key else {}
+    return api.app.test_client().post("/drop_coordinates", data=json.dumps(body), headers=headers,
+                                      content_type="application/json")
+
+
+def test_replay_after_completion():
+    cache = DispatchCache()
+    entry, owner = cache.claim("k", (1, 2))
+    assert owner
+    cache.complete(entry, ({"status": "ok"}, 200))
+    replayed, owner = cache.claim("k", (1, 2))
+    assert not owner
+    assert replayed is entry
+    assert replayed.response == ({"status": "ok"}, 200)
+
+
+def test_duplicate_joins_in_flight_dispatch():
+    cache = DispatchCache()
+    entry, _ = cache.claim("k", (1, 2))
+    joined, owner = cache.claim("k", (1, 2))
+    assert not owner and joined is entry
+    assert not joined.done.is_set()
+    threading.Timer(0.05, cache.complete, (entry, ({"status": "ok"}, 200))).start()
+    assert joined.done.wait(2)
+    assert joined.response == ({"status": "ok"}, 200)
+
+
+def test_ttl_runs_from_completion(clock):
+    cache = DispatchCache(ttl=10)
+    entry, _ = cache.claim("k", (1, 2))
+    clock.now += 100  # a slow dispatch
+    cache.complete(entry, ({"status": "ok"}, 200))
+    clock.now += 9
+    assert cache.claim("k", (1, 2)) == (entry, False)
+    clock.now += 2
+    fresh, owner = cache.claim("k", (1, 2))
+    assert owner and fresh is not entry
+
+
+def test_size_bound_evicts_only_finished_entries(clock):
+    cache = DispatchCache(max_entries=2)
+    cache.claim("in-flight", (1, 2))
+    finished, _ = cache.claim("finished", (1, 2))
+    cache.complete(finished, ({"status": "ok"}, 200))
+    cache.claim("also-in-flight", (1, 2))
+    cache.claim("new", (1, 2))
+    assert list(cache.entries) == ["in-flight", "also-in-flight", "new"]
+
+
+def test_reused_key_with_different_coordinates_conflicts(api):
+    assert post(api, DROP, key="k").status_code == 200
+    response = post(api, {**DROP, "latitude": DROP["latitude"] + 0.001}, key="k")
+    assert response.status_code == 409
+    assert len(api.dispatches) == 1
+
+
+def test_retry_replays_stored_response(api):
+    first = post(api, DROP, key="k")
+    retry = post(api, DROP, key="k")
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.get_json() == first.get_json()
+    assert len(api.dispatches) == 1
+
+
+def test_unavailable_response_is_not_replayed(api):
+    api.drone_controller.connection_established.clear()
+    assert post(api, DROP, key="k").status_code == 503
+    api.drone_controller.connection_established.set()
+    response = post(api, DROP, key="k")
+    assert response.status_code == 200
+    assert "Idempotent-Replayed" not in response.headers
+    assert len(api.dispatches) == 1
+
+
+@pytest.mark.parametrize("body", [None, [], "DRONE_TEST", 7])
+def test_non_object_body_is_rejected(api, body):
+    assert post(api, body).status_code == 400
+    assert api.dispatches == []
@@ -0,0 +1,147 @@
+import json
+import os
+import time
+
+import pytest
+
+import geofence
+from geofence import (GeofenceStore, GridIndex, Zone, FenceSet, NO_FLY, DELIVERY_ZONE,
+                      point_in_ring, segments_intersect)
+
+SQUARE = [(0, 0), (2, 0), (2, 2), (0, 2), (0, 0)]
+HOLE = [(0.5, 0.5), (1.5, 0.5), (1.5, 1.5), (0.5, 1.5), (0.5, 0.5)]
+
+
+def square(x, y, size):
+    return [(x, y), (x + size, y), (x + size, y + size), (x, y + size), (x, y)]
+
+
+def feature(ring, kind=NO_FLY, name=None, site=None):
+    properties = {"kind": kind}
+    if name:
+        properties["name"] = name
+    if site:
+        properties["site"] = site
+    return {"type": "Feature", "properties": properties,
+            "geometry": {"type": "Polygon", "coordinates": [[list(point) for point in ring]]}}
+
+
+def write_fences(path, features):
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+    return str(path)
+
+
+@pytest.mark.parametrize("point, expected", [
+    ((1, 1), True),
+    ((3, 1), False),
+    ((-0.1, 1), False),
+    ((1, 2.5), False),
+    ((1.999, 0.001), True),
+])
+def test_point_in_ring(point, expected):
+    assert point_in_ring(*point, SQUARE) is expected
+
+
+def test_point_in_concave_ring():
+    u_shape = [(0, 0), (3, 0), (3, 3), (2, 3), (2, 1), (1, 1), (1, 3), (0, 3), (0, 0)]
+    assert point_in_ring(0.5, 2, u_shape)
+    assert not point_in_ring(1.5, 2, u_shape)
+
+
+@pytest.mark.parametrize("p1, p2, q1, q2, expected", [
+    ((0, 0), (2, 2), (0, 2), (2, 0), True),   # proper crossing
+    ((0, 0), (1, 1), (2, 2), (3, 3), False),  # collinear, disjoint
+    ((0, 0), (2, 2), (1, 1), (3, 3), True),   # collinear, overlapping
+    ((0, 0), (1, 0), (1, 0), (1, 1), True),   # touching at an endpoint
+    ((0, 0), (1, 0), (0, 1), (1, 1), False),  # parallel
+    ((0, 0), (1, 1), (2, 0), (1.6, 0.5), False),
+])
+def test_segments_intersect(p1, p2, q1, q2, expected):
+    assert segments_intersect(p1, p2, q1, q2) is expected
+
+
+def test_zone_excludes_holes():
+    zone = Zone("donut", NO_FLY, None, [SQUARE, HOLE])
+    assert zone.contains(0.25, 0.25)
+    assert not zone.contains(1, 1)
+
+
+def test_zone_segment_crossing_without_endpoints_inside():
+    zone = Zone("square", NO_FLY, None, [SQUARE])
+    assert zone.intersects_segment((-1, 1), (3, 1))
+    assert not zone.intersects_segment((-1, 3), (3, 3))
+
+
+def test_grid_index_candidates():
+    small = Zone("small", NO_FLY, None, [square(0.001, 0.001, 0.002)])
+    far = Zone("far", NO_FLY, None, [square(0.5, 0.5, 0.002)])
+    index = GridIndex([small, far])
+    assert index.candidates_at(0.002, 0.002) == [small]
+    assert index.candidates_at(0.3, 0.3) == []
+    assert {zone.name for zone in index.candidates_in((0, 0, 0.6, 0.6))} == {"small", "far"}
+
+
+def test_grid_index_keeps_large_zones_unindexed():
+    huge = Zone("huge", NO_FLY, None, [square(0, 0, 10)])
+    index = GridIndex([huge])
+    assert index.unindexed == [huge]
+    assert index.candidates_at(5, 5) == [huge]
+    assert index.candidates_in((20, 20, 21, 21)) == [huge]
+
+
+def test_grid_index_matches_brute_force():
+    zones = [Zone(f"z{i}", NO_FLY, None, [square(i * 0.013, (i % 7) * 0.011, 0.02)]) for i in range(50)]
+    fences = FenceSet(zones)
+    store = GeofenceStore()
+    store.fences = fences
+    for i in range(200):
+        lon, lat = (i * 0.0037) % 0.7, (i * 0.0021) % 0.1
+        expected = [zone for zone in zones if zone.contains(lon, lat)]
+        found = store.no_fly_zone_at(lat, lon)
+        assert (found is None) == (not expected)
+        assert found is None or found in expected
+
+
+def test_check_route(tmp_path):
+    store = GeofenceStore(write_fences(tmp_path / "fences.json", [feature(square(149.1655, -35.3628, 0.0003), name="school")]))
+    assert store.check_route([(-35.3632, 149.1652), (-35.3640, 149.1660)]) is None
+    assert "inside no-fly zone school" in store.check_route([(-35.36265, 149.16565)])
+    assert "crosses no-fly zone school" in store.check_route([(-35.3632, 149.1652), (-35.3620, 149.1660)])
+
+
+def test_delivery_zone_for_site(tmp_path):
+    path = write_fences(tmp_path / "fences.json", [feature(square(149.16, -35.37, 0.01), DELIVERY_ZONE, site="A")])
+    store = GeofenceStore(path, site="A")
+    assert store.in_delivery_zone(-35.365, 149.165)
+    assert not store.in_delivery_zone(-35.38, 149.165)
+
+
+def test_delivery_zone_fails_closed_for_unknown_site(tmp_path):
+    path = write_fences(tmp_path / "fences.json", [feature(square(149.16, -35.37, 0.01), DELIVERY_ZONE, site="A")])
+    store = GeofenceStore(path, site="typo")
+    assert not store.in_delivery_zone(-35.365, 149.165)
+
+
+def test_no_delivery_zones_allows_any_drop(tmp_path):
+    store = GeofenceStore(write_fences(tmp_path / "fences.json", []), site="A")
+    assert store.in_delivery_zone(10, 10)
+
+
+def test_invalid_file_keeps_previous_fences(tmp_path):
+    path = tmp_path / "fences.json"
+    store = GeofenceStore(write_fences(path, [feature(SQUARE, name="square")]))
+    path.write_text("{not json")
+    assert not store.reload()
+    assert store.no_fly_zone_at(1, 1).name == "square"
+
+
+def test_watcher_reloads_changed_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(geofence, "RELOAD_CHECK_INTERVAL", 0.05)
+    path = tmp_path / "fences.json"
+    store = GeofenceStore(write_fences(path, []))
+    write_fences(path, [feature(SQUARE, name="square")])
+    os.utime(path, (time.time() + 5, time.time() + 5))
+    deadline = time.time() + 2
+    while store.no_fly_zone_at(1, 1) is None and time.time() < deadline:
+        time.sleep(0.05)
+    assert store.no_fly_zone_at(1, 1).name == "square"
@@ -0,0 +1,89 @@
+import pytest
+
+from mission_store import MissionStore, MAX_PAGE_SIZE
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = MissionStore(str(tmp_path / "missions.db"))
+    yield store
+    store.close()
+
+
+def record(store, mission_id, created_at, drone_id="D1", lat=-35.36, lon=149.16, success=True):
+    store.record_dispatch(mission_id, drone_id, created_at, lat, lon, success, "ok", {"upload": 0.5}, 1.5)
+
+
+def all_pages(store, **filters):
+    pages, cursor = [], None
+    while True:
+        missions, cursor = store.list_missions(cursor=cursor, **filters)
+        pages.append([mission["id"] for mission in missions])
+        if cursor is None:
+            return pages
+
+
+def test_close_flushes_queued_records(store):
+    for i in range(5):
+        record(store, f"m{i}", 100 + i)
+    store.close()
+    missions, next_cursor = store.list_missions()
+    assert [mission["id"] for mission in missions] == ["m4", "m3", "m2", "m1", "m0"]
+    assert next_cursor is None
+    assert missions[0]["success"] is True
+    assert missions[0]["stage_timings"] == {"upload": 0.5}
+
+
+def test_record_flight_updates_existing_row(store):
+    record(store, "m1", 100)
+    store.record_flight("m1", 42.0)
+    store.close()
+    missions, _ = store.list_missions()
+    assert missions[0]["flight_duration"] == 42.0
+    assert missions[0]["dispatch_duration"] == 1.5
+
+
+def test_pages_are_newest_first_with_ties_broken_by_id(store):
+    for mission_id, created_at in [("a", 100), ("b", 101), ("c", 101), ("d", 101), ("e", 102)]:
+        record(store, mission_id, created_at)
+    store.close()
+    assert all_pages(store, limit=2) == [["e", "d"], ["c", "b"], ["a"]]
+
+
+def test_last_full_page_has_no_cursor(store):
+    for i in range(4):
+        record(store, f"m{i}", 100 + i)
+    store.close()
+    assert all_pages(store, limit=2) == [["m3", "m2"], ["m1", "m0"]]
+
+
+def test_limit_is_clamped(store):
+    for i in range(3):
+        record(store, f"m{i}", 100 + i)
+    store.close()
+    missions, next_cursor = store.list_missions(limit=0)
+    assert [mission["id"] for mission in missions] == ["m2"]
+    assert next_cursor is not None
+    assert len(store.list_missions(limit=MAX_PAGE_SIZE + 1)[0]) == 3
+
+
+def test_drone_filter(store):
+    record(store, "m1", 100, drone_id="D1")
+    record(store, "m2", 101, drone_id="D2")
+    store.close()
+    assert all_pages(store, drone_id="D2") == [["m2"]]
+
+
+def test_time_range_includes_since_and_excludes_until(store):
+    for i in range(5):
+        record(store, f"m{i}", 100 + i)
+    store.close()
+    assert all_pages(store, since=101, until=103) == [["m2", "m1"]]
+
+
+def test_bbox_filter_is_inclusive(store):
+    record(store, "inside", 100, lat=-35.36, lon=149.16)
+    record(store, "edge", 101, lat=-35.35, lon=149.17)
+    record(store, "outside", 102, lat=-35.30, lon=149.16)
+    store.close()
+    assert all_pages(store, bbox=(-35.37, 149.15, -35.35, 149.17)) == [["edge", "inside"]]